@@ -1,13 +1,33 @@
 import streamlit as st
 import gspread
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import json
+import re
 from datetime import datetime
 
 # --- CONFIGURATION ---
 SHEET_NAME = 'interac Payments recieved'
 CREDENTIALS_FILE = 'credentials.json'
 
+# The dashboard only reads Date, Sender, Amount and Doctor, which live in
+# the first four columns of the Payments tab; fetching just that range
+# keeps bookkeeping columns off the wire and out of the DataFrame.
+SHEET_RANGE = 'Payments!A:D'
+
+# Cap on rows serialized to the browser per table render
+MAX_ROWS = 500
+
+# Strips currency symbols and thousands separators from Amount values
+_CURRENCY_RE = re.compile(r'[$,]')
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+# Must be the first Streamlit call of the script run
+st.set_page_config(page_title="Kitchener Finance", layout="wide")
+
 # --- CONNECT TO GOOGLE ---
 @st.cache_resource
 def get_connection():
@@ -22,56 +42,127 @@ def get_connection():
         st.error(f"❌ Error: {e}")
         st.stop()
 
+# Resolve the cached client once at script start so credential problems
+# surface immediately instead of mid-render.
+get_connection()
+
+@st.cache_data(ttl=300, show_spinner=False)
 def get_data():
     gc = get_connection()
     sh = gc.open(SHEET_NAME)
-    worksheet = sh.worksheet("Payments")
-    
-    data = worksheet.get_all_values()
+
+    # One values.batchGet round-trip instead of a worksheet metadata fetch
+    # followed by a separate get_all_values call.
+    response = sh.values_batch_get([SHEET_RANGE])
+    data = response['valueRanges'][0].get('values', [])
+    if not data:
+        return pd.DataFrame()
     headers = data[0]
     rows = data[1:]
     cleaned_headers = [h.strip() for h in headers]
-    df = pd.DataFrame(rows, columns=cleaned_headers)
+
+    # Build an Arrow string table instead of an object-dtype frame: the API
+    # trims trailing empty cells, so pad each row out to the header width,
+    # then let Arrow-backed columns handle the string cleanup vectorized.
+    width = len(cleaned_headers)
+    columns = list(zip(*(row + [''] * (width - len(row)) for row in rows)))
+    table = pa.table({h: pa.array(c, type=pa.string())
+                      for h, c in zip(cleaned_headers, columns)})
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
     return df
 
+@st.cache_data(ttl=300, show_spinner=False)
+def load_clean_df():
+    df = get_data()
+    # Token identifying this cache fill; view memos keyed on it expire
+    # whenever the data refreshes.
+    token = datetime.now().timestamp()
+    if df.empty:
+        return df, None, token
+
+    # 1. CLEAN DATA
+    # Blank/whitespace dates coerce to NaT below, so no separate strip pass.
+    df['Date Object'] = pd.to_datetime(df['Date'], errors='coerce')
+    df = df.dropna(subset=['Date Object'])
+
+    # Amount stays float64: float32 loses cent-exactness on the displayed
+    # totals and mangles raw cell values in the table.
+    df['Amount'] = pd.to_numeric(df['Amount'].astype('string').str.replace(_CURRENCY_RE, '', regex=True), errors='coerce')
+
+    # Integer year/month are enough for filtering and grouping; month names
+    # are looked up in MONTH_NAMES only when a label is rendered, which
+    # avoids a per-row strftime pass.
+    df['Year'] = df['Date Object'].dt.year.astype('int16')
+    df['Month'] = df['Date Object'].dt.month.astype('int8')
+
+    # Normalize the free-text Doctor column once so metrics can filter on
+    # category codes instead of re-running case-insensitive substring scans.
+    doctor = df['Doctor'].astype('string').str.lower()
+    df['Doctor_Key'] = np.where(doctor.str.contains('tripic', regex=False, na=False), 'tripic',
+                       np.where(doctor.str.contains('cartagena', regex=False, na=False), 'cartagena', 'other'))
+    df['Doctor_Key'] = df['Doctor_Key'].astype('category')
+
+    # Sender and Doctor repeat a handful of values per thousands of rows;
+    # category dtype stores codes plus one small dictionary, which also
+    # shrinks the Arrow payload st.dataframe ships to the browser.
+    for col in ('Sender', 'Doctor'):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    # 2. AGGREGATE ONCE
+    # All displayed totals are sums over (Year, Month, Doctor), so compute
+    # them in one groupby here and let main() do plain index lookups.
+    agg = (df.groupby(['Year', 'Month', 'Doctor_Key'], observed=True)['Amount']
+             .sum()
+             .unstack('Doctor_Key', fill_value=0.0)
+             .reindex(columns=['tripic', 'cartagena', 'other'], fill_value=0.0))
+
+    # Sort newest-first once, then index by (Year, Month) so per-rerun
+    # filtering is a binary-search slice instead of a boolean-mask scan.
+    # The descending stable index sort keeps rows newest-first overall.
+    df = df.sort_values('Date Object', ascending=False, kind='stable')
+    df = df.set_index(['Year', 'Month']).sort_index(ascending=False, kind='stable')
+    return df, agg, token
+
+def build_view(year_df, year_agg, year_total, selected_year, selected_month_view):
+    if selected_month_view == "All Months":
+        display_df = year_df
+        view_title = f"All Activity in {selected_year}"
+        month_total = year_total
+    else:
+        display_df = year_df.loc[[(selected_year, selected_month_view)]]
+        view_title = f"Activity in {MONTH_NAMES[selected_month_view - 1]} {selected_year}"
+        month_total = year_agg.loc[selected_month_view].sum()
+    return display_df, view_title, month_total
+
 # --- DASHBOARD ---
 def main():
-    st.set_page_config(page_title="Kitchener Finance", layout="wide")
-    
     if st.sidebar.button("🔄 FORCE REFRESH"):
         st.cache_data.clear()
+        for key in [k for k in st.session_state if isinstance(k, tuple) and k[0] == 'view']:
+            del st.session_state[key]
         st.rerun()
 
     try:
-        df = get_data()
+        df, agg, token = load_clean_df()
     except Exception as e:
         st.error(f"Error reading sheet: {e}")
         st.stop()
 
     if not df.empty:
-        # 1. CLEAN DATA
-        df = df[df['Date'].astype(str).str.strip() != ""]
-        df['Date Object'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.dropna(subset=['Date Object'])
-        
-        df['Amount'] = pd.to_numeric(df['Amount'].astype(str).str.replace('$','').str.replace(',',''), errors='coerce')
-        
-        df['Year'] = df['Date Object'].dt.year
-        df['Month_Name'] = df['Date Object'].dt.strftime('%B')
-        df['Month_Year'] = df['Date Object'].dt.strftime('%B %Y')
-
         # --- SIDEBAR ---
         st.sidebar.header("📅 Time Filters")
-        available_years = sorted(df['Year'].unique(), reverse=True)
+        available_years = sorted(df.index.get_level_values('Year').unique(), reverse=True)
         selected_year = st.sidebar.selectbox("Select Year", available_years)
-        year_df = df[df['Year'] == selected_year]
+        year_df = df.loc[[selected_year]]
 
         # --- MAIN PAGE ---
         st.title(f"💰 Kitchener Financial Overview: {selected_year}")
         
-        year_total = year_df['Amount'].sum()
-        year_tripic = year_df[year_df['Doctor'].astype(str).str.contains("Tripic", case=False)]['Amount'].sum()
-        year_cartagena = year_df[year_df['Doctor'].astype(str).str.contains("Cartagena", case=False)]['Amount'].sum()
+        year_agg = agg.loc[selected_year]
+        year_total = year_agg.to_numpy().sum()
+        year_tripic = year_agg['tripic'].sum()
+        year_cartagena = year_agg['cartagena'].sum()
 
         ym1, ym2, ym3 = st.columns(3)
         ym1.metric(f"Total Kitchener Income ({selected_year})", f"${year_total:,.2f}")
@@ -83,29 +174,38 @@ def main():
         # --- MONTHLY DETAILS ---
         st.subheader(f"🗓️ Monthly Details ({selected_year})")
         
-        available_months = list(year_df['Month_Name'].unique())
-        month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-        available_months.sort(key=lambda x: month_order.index(x) if x in month_order else 99)
-        
-        view_options = ["All Months"] + available_months
-        selected_month_view = st.selectbox("Filter by Month", view_options)
+        available_months = sorted(year_df.index.get_level_values('Month').unique())
 
-        if selected_month_view == "All Months":
-            display_df = year_df
-            view_title = f"All Activity in {selected_year}"
-        else:
-            display_df = year_df[year_df['Month_Name'] == selected_month_view]
-            view_title = f"Activity in {selected_month_view} {selected_year}"
+        view_options = ["All Months"] + available_months
+        selected_month_view = st.selectbox(
+            "Filter by Month", view_options,
+            format_func=lambda m: m if m == "All Months" else MONTH_NAMES[m - 1]
+        )
 
-        month_total = display_df['Amount'].sum()
+        # Reruns triggered by other widgets reuse the view built for this
+        # (year, month) selection instead of re-slicing. The load token in
+        # the key invalidates memoized views when the data cache refills;
+        # views from previous fills are dropped so the memo stays bounded.
+        view_key = ('view', token, selected_year, selected_month_view)
+        if view_key not in st.session_state:
+            for key in [k for k in st.session_state
+                        if isinstance(k, tuple) and k[0] == 'view' and k[1] != token]:
+                del st.session_state[key]
+            st.session_state[view_key] = build_view(
+                year_df, year_agg, year_total, selected_year, selected_month_view
+            )
+        display_df, view_title, month_total = st.session_state[view_key]
         st.markdown(f"**{view_title}** - Total: **${month_total:,.2f}**")
         
         display_cols = ["Date", "Sender", "Amount", "Doctor"]
-        
-        # Make sure 'Date Object' is used for sorting
+
+        # Already sorted newest-first by the loader
+        shown = display_df.head(MAX_ROWS)
+        if len(shown) < len(display_df):
+            st.caption(f"Showing {len(shown)} of {len(display_df)} rows")
         st.dataframe(
-            display_df.sort_values(by="Date Object", ascending=False)[display_cols], 
-            use_container_width=True, 
+            shown[display_cols],
+            use_container_width=True,
             hide_index=True
         )
         